@@ -8,6 +8,11 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
 from scipy.linalg import svd
 import os
+import bisect
+from typing import Literal
+from artifacts import catalog_version, load_or_build_artifacts, get_artifacts
+from profiling import ProfilingMiddleware
+from facets import RuleTables, build_genre_bits, compile_facets
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -22,6 +27,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in profiling of recommendation requests (configured through env vars, see profiling.py)
+app.add_middleware(ProfilingMiddleware)
+
 # Mood-to-Genre Mapping for Books
 mood_to_book_genres = {
     'light': [
@@ -172,6 +180,19 @@ movie_genre_mapping = {
     'family': 'Family'
 }
 
+# Rule tables that can be overridden from a JSON file without restarting (see facets.py)
+rule_tables = RuleTables({
+    'mood_to_book_genres': (mood_to_book_genres, 'genres'),
+    'mood_to_anime_genres': (mood_to_anime_genres, 'genres'),
+    'mood_to_movie_genres': (mood_to_movie_genres, 'genres'),
+    'era_to_book_genres': (era_to_book_genres, 'genres'),
+    'era_to_anime_years': (era_to_anime_years, 'years'),
+    'era_to_movie_years': (era_to_movie_years, 'years'),
+    'book_genre_mapping': (book_genre_mapping, 'genre'),
+    'anime_genre_mapping': (anime_genre_mapping, 'genre'),
+    'movie_genre_mapping': (movie_genre_mapping, 'genre')
+}, os.environ.get('MEDIAMATCHR_FACETS_PATH', os.path.join(os.path.dirname(__file__), 'facets.json')))
+
 # Load the datasets
 @app.on_event("startup")
 async def startup_db_client():
@@ -275,11 +296,185 @@ class RecommendationRequest(BaseModel):
     era: str = None  
     genre: str = None
     domain: str = "book"  # Default to books, can be "anime"
+    fusion: Literal["rrf", "max"] = None  # Fuse per-seed neighbors instead of averaging seeds
+
+
+# Function to Build the Shared Per-Domain Artifacts
+def build_catalog_artifacts(df, domain="book"):
+    """Build the full-catalog latent matrix, genre bitsets and title index for a domain."""
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    
+    # Latent matrix over the whole catalog, using the same features as build_model
+    latent_matrix = compute_latent_matrix(df, domain)
+    
+    # Genre bitsets: one bit per genre token, packed into bytes for each item
+    genre_vocab, genre_bits = build_genre_bits(df, genre_col)
+    
+    return {
+        'latent': latent_matrix.astype(np.float32),
+        'genre_vocab': genre_vocab,
+        'genre_bits': genre_bits,
+        **build_title_index(df),
+    }
+
+def build_title_index(df):
+    """Sorted normalized titles for prefix search, with catalog rows and votes in the same order.
+
+    The titles are stored as one UTF-8 buffer plus offsets rather than a fixed-width string
+    array, so a single long title does not pad every row to its length.
+    """
+    title_keys = df['title'].fillna('').astype(str).str.lower().str.strip().to_numpy(dtype=object)
+    # Code point order, which is also the byte order of the UTF-8 encoded keys
+    title_order = np.argsort(title_keys, kind='stable')
+    encoded = [key.encode('utf-8') for key in title_keys[title_order]]
+    title_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key in encoded], out=title_offsets[1:])
+    votes = df['num_votes'].fillna(0).to_numpy(dtype=np.float64) if 'num_votes' in df.columns else np.zeros(len(df))
+    return {
+        'title_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'title_offsets': title_offsets,
+        'title_order': title_order.astype(np.int64),
+        'title_votes': votes[title_order],
+    }
+
+class TitleKeys:
+    """Sequence view of the sorted UTF-8 title keys in a title index, for bisect."""
+    
+    def __init__(self, title_index):
+        self.buffer = title_index['title_bytes']
+        self.offsets = title_index['title_offsets']
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+def get_title_index(domain):
+    """Title index from the shared artifacts, or a private one for this worker when they are unavailable."""
+    artifacts = get_domain_artifacts(domain)
+    if artifacts is not None and 'title_offsets' in artifacts:
+        return artifacts
+    
+    if not hasattr(app, 'title_indexes'):
+        app.title_indexes = {}
+    df = getattr(app, f"{domain}_df", None)
+    title_index = app.title_indexes.get(domain)
+    if df is not None and (title_index is None or len(title_index['title_order']) != len(df)):
+        title_index = app.title_indexes[domain] = build_title_index(df)
+    return title_index
+
+def search_title_prefix(title_index, prefix, limit=10):
+    """Catalog rows whose normalized title starts with prefix, most-voted first."""
+    keys = TitleKeys(title_index)
+    prefix = prefix.encode('utf-8')
+    lo = bisect.bisect_left(keys, prefix)
+    # 0xff never occurs in UTF-8, so this sorts after every key starting with prefix
+    hi = bisect.bisect_left(keys, prefix + b'\xff', lo)
+    if hi <= lo:
+        return []
+    
+    # Rank the matching slice by votes, pulling a few extra to make up for duplicate titles
+    votes = np.asarray(title_index['title_votes'][lo:hi])
+    n_top = min(limit * 3, hi - lo)
+    top = np.argpartition(-votes, n_top - 1)[:n_top]
+    # Ties go to the earlier catalog row, the same row match_seed_indices picks for an exact title
+    top = top[np.lexsort((top, -votes[top]))]
+    
+    rows = []
+    seen = set()
+    for offset in top:
+        key = keys[lo + offset]
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append(int(title_index['title_order'][lo + offset]))
+        if len(rows) == limit:
+            break
+    return rows
+
+def get_domain_artifacts(domain):
+    """Return the shared artifacts that line up with this worker's catalog, if published."""
+    version = getattr(app, 'artifact_versions', {}).get(domain)
+    if not version:
+        return None
+    return get_artifacts(domain, version)
+
+def catalog_positions(df, subset_df):
+    """Row positions in the full catalog of the rows in a filtered subset."""
+    return df.index.get_indexer(subset_df.index)
+
+# Function to Compile the Mood/Era/Genre Facet Tables
+def compile_domain_facets(domain):
+    """Compile a domain's current rule tables into per-item facet bitmaps."""
+    df = getattr(app, f"{domain}_df")
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    
+    if domain == "anime":
+        rules = (mood_to_anime_genres, era_to_anime_years, anime_genre_mapping, 'aired_from_year')
+    elif domain == "movie":
+        rules = (mood_to_movie_genres, era_to_movie_years, movie_genre_mapping, 'year')
+    else:  # Books use genres as an era proxy
+        rules = (mood_to_book_genres, era_to_book_genres, book_genre_mapping, None)
+    mood_rules, era_rules, genre_rules, era_year_column = rules
+    
+    # Reuse the shared genre bitsets when this worker has them
+    artifacts = get_domain_artifacts(domain)
+    if artifacts is not None:
+        genre_vocab, genre_bits = artifacts['genre_vocab'], artifacts['genre_bits']
+    else:
+        genre_vocab, genre_bits = build_genre_bits(df, genre_col)
+    
+    return compile_facets(df, mood_rules, era_rules, genre_rules, genre_vocab, genre_bits, era_year_column)
+
+def compile_all_facets():
+    app.facet_tables = {}
+    for domain in ['book', 'anime', 'movie']:
+        if getattr(app, f"{domain}_df", None) is None:
+            continue
+        try:
+            app.facet_tables[domain] = compile_domain_facets(domain)
+        except Exception as e:
+            print(f"Error compiling {domain} facets: {e}")
+
+def get_facet_table(domain):
+    """Facet table for a domain, recompiling if the rule config or the catalog changed.
+
+    Returns None (the row-by-row rule filters take over) if anything goes wrong, so a bad
+    config file can never fail a request.
+    """
+    try:
+        if rule_tables.refresh() or not hasattr(app, 'facet_tables'):
+            compile_all_facets()
+        facets = app.facet_tables.get(domain)
+        if facets is not None and facets.n_items != len(getattr(app, f"{domain}_df")):
+            facets = app.facet_tables[domain] = compile_domain_facets(domain)
+        return facets
+    except Exception as e:
+        print(f"Error preparing {domain} facets, using rule filters: {e}")
+        return None
 
 
 # Function to Filter Dataset Based on Mood, Era, and Genre
-def filter_dataset(df, mood, era, genre, domain="book"):
+def filter_dataset(df, mood, era, genre, domain="book", facets=None):
     """Filter the dataset based on user-selected mood, era, and genre."""
+    if facets is not None:
+        # Precompiled facet columns resolve mood, era and genre with a single mask lookup
+        mask = facets.mask(mood, era, genre)
+        filtered_df = df if mask is None else df[mask]
+    else:
+        filtered_df = filter_dataset_by_rules(df, mood, era, genre, domain)
+    
+    # If we filtered too aggressively, return original dataset
+    print(len(filtered_df))
+    if len(filtered_df) < 1:
+        print(f"Warning: Too few {domain}s match filters. Using broader dataset.")
+        return df
+    
+    return filtered_df
+
+def filter_dataset_by_rules(df, mood, era, genre, domain="book"):
+    """Apply the mood, era, and genre rule tables row by row (used when no facet table is compiled)."""
     filtered_df = df.copy()
     
     # Get appropriate genre mapping and mood-to-genre mapping based on domain
@@ -329,17 +524,11 @@ def filter_dataset(df, mood, era, genre, domain="book"):
             year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
             filtered_df = filtered_df[year_filter]
     
-    # If we filtered too aggressively, return original dataset
-    print(len(filtered_df))
-    if len(filtered_df) < 1:
-        print(f"Warning: Too few {domain}s match filters. Using broader dataset.")
-        return df
-    
     return filtered_df
 
-# Function to Build Feature Matrix and Train Model
-def build_model(filtered_df, domain="book"):
-    """Build the feature matrix and train the SVD-KNN model on the filtered dataset."""
+# Function to Build Feature Matrix and Reduce it with SVD
+def compute_latent_matrix(filtered_df, domain="book", rank=50):
+    """Build the TF-IDF/rating feature matrix and project it onto its top SVD components."""
     # Determine genre column name based on domain
     genre_col = 'genres' if domain == 'book' else 'genre'
     
@@ -354,45 +543,109 @@ def build_model(filtered_df, domain="book"):
     
     # Apply SVD
     U, Sigma, Vt = svd(feature_matrix, full_matrices=False)
-    k = min(50, feature_matrix.shape[1] - 1)  # Adjust k if feature matrix is smaller
+    k = min(rank, feature_matrix.shape[1] - 1)  # Adjust k if feature matrix is smaller
     U_k = U[:, :k]
     Sigma_k = np.diag(Sigma[:k])
     latent_matrix = np.dot(U_k, Sigma_k)
     
+    return latent_matrix
+
+# Function to Build Feature Matrix and Train Model
+def build_model(filtered_df, domain="book", latent_matrix=None):
+    """Build the feature matrix and train the SVD-KNN model on the filtered dataset.
+
+    When latent_matrix is given (rows of the shared catalog artifacts), the SVD step is skipped.
+    """
+    if latent_matrix is None:
+        latent_matrix = compute_latent_matrix(filtered_df, domain)
+    
     # Apply KNN
     knn = NearestNeighbors(n_neighbors=6, metric='cosine')
     knn.fit(latent_matrix)
     
     return latent_matrix, knn, filtered_df
 
-# Function to Find Similar Items
-def find_similar_items(titles, full_df, filtered_df, latent_matrix, knn_model, domain="book", n_recommendations=5):
-    """Find similar items based on input titles."""
-    # Find matching items in the filtered dataset
+# Reciprocal-rank fusion constant (the usual value from the RRF literature)
+RRF_K = 60
+
+# Function to Resolve Seed Titles
+def match_seed_indices(titles, filtered_df, best_match=False):
+    """Positions in filtered_df of the items matching the input titles.
+
+    An exact (case-insensitive) title wins, and among rows sharing it the most-voted one
+    (the first on ties), which is the row /autocomplete returns for that title. Otherwise
+    a title takes its first literal substring match, or with best_match the most-voted one.
+    """
     item_indices = []
     
     # Determine title column based on domain
     title_column = 'title'
+    normalized_titles = filtered_df[title_column].str.lower().str.strip()
     
     for title in titles:
         title = title.lower().strip()
-        matching_items = filtered_df[filtered_df[title_column].str.lower().str.contains(title, na=False)]
-        if not matching_items.empty:
-            item_indices.append(filtered_df.index.get_loc(matching_items.index[0]))
+        matching_items = filtered_df[normalized_titles == title]
+        rank_by_votes = True
+        if matching_items.empty:
+            matches = normalized_titles.str.contains(title, na=False, regex=False)
+            matching_items = filtered_df[matches]
+            if matching_items.empty:
+                continue
+            rank_by_votes = best_match
+        if rank_by_votes and len(matching_items) > 1 and 'num_votes' in matching_items.columns:
+            matching_items = matching_items.sort_values('num_votes', ascending=False, kind='stable')
+        item_indices.append(filtered_df.index.get_loc(matching_items.index[0]))
+    
+    return item_indices
+
+def fuse_seed_neighbors(latent_matrix, knn_model, item_indices, n_recommendations, fusion="rrf"):
+    """Search every seed's neighbors in one batched query and merge the rankings."""
+    # A seed named twice would count twice in the fusion, so keep its first occurrence
+    item_indices = list(dict.fromkeys(item_indices))
+    n_neighbors = min(n_recommendations + len(item_indices), latent_matrix.shape[0])
+    distances, indices = knn_model.kneighbors(latent_matrix[item_indices], n_neighbors=n_neighbors)
+    
+    input_indices_set = set(item_indices)
+    scores = {}
+    for seed_distances, seed_indices in zip(distances, indices):
+        rank = 0
+        for distance, idx in zip(seed_distances, seed_indices):
+            if idx in input_indices_set:
+                continue
+            rank += 1
+            if fusion == "max":
+                # Cosine similarity of the closest seed
+                scores[idx] = max(scores.get(idx, -1.0), 1.0 - distance)
+            else:
+                scores[idx] = scores.get(idx, 0.0) + 1.0 / (RRF_K + rank)
+    
+    return sorted(scores, key=scores.get, reverse=True)[:n_recommendations]
+
+# Function to Find Similar Items
+def find_similar_items(titles, full_df, filtered_df, latent_matrix, knn_model, domain="book", n_recommendations=5, fusion=None):
+    """Find similar items based on input titles.
+
+    fusion=None averages the seeds into one query vector; "rrf" or "max" fuses per-seed results.
+    """
+    # Find matching items in the filtered dataset
+    item_indices = match_seed_indices(titles, filtered_df, best_match=fusion in ("rrf", "max"))
     
     if not item_indices:
         # Fallback to popular items if no matches
         return full_df.sort_values('num_votes', ascending=False).head(n_recommendations)
     
-    # Aggregate latent features of input items
-    aggregated_features = np.mean(latent_matrix[item_indices], axis=0).reshape(1, -1)
-    
-    # Find nearest neighbors
-    distances, indices = knn_model.kneighbors(aggregated_features, n_neighbors=n_recommendations + len(item_indices))
-    
-    # Filter out input items from recommendations
-    input_indices_set = set(item_indices)
-    similar_indices = [idx for idx in indices[0] if idx not in input_indices_set][:n_recommendations]
+    if fusion in ("rrf", "max"):
+        similar_indices = fuse_seed_neighbors(latent_matrix, knn_model, item_indices, n_recommendations, fusion)
+    else:
+        # Aggregate latent features of input items
+        aggregated_features = np.mean(latent_matrix[item_indices], axis=0).reshape(1, -1)
+        
+        # Find nearest neighbors
+        distances, indices = knn_model.kneighbors(aggregated_features, n_neighbors=n_recommendations + len(item_indices))
+        
+        # Filter out input items from recommendations
+        input_indices_set = set(item_indices)
+        similar_indices = [idx for idx in indices[0] if idx not in input_indices_set][:n_recommendations]
     
     # Extract appropriate fields based on domain
     if domain == "anime":
@@ -424,12 +677,16 @@ async def get_book_recommendations(request: RecommendationRequest):
         # Force domain to be "book" regardless of what was sent
         domain = "book"
         df = app.book_df
+        
+        # Shared catalog artifacts published at startup (None if unavailable)
+        artifacts = get_domain_artifacts(domain)
             
         # Filter the dataset based on user preferences
-        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain)
+        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain, get_facet_table(domain))
         
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
+        # Build the model, reusing the shared latent rows when we have them
+        latent_rows = artifacts['latent'][catalog_positions(df, filtered_df)] if artifacts is not None else None
+        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain, latent_rows)
         
         # Get recommendations
         similar_items = find_similar_items(
@@ -439,7 +696,8 @@ async def get_book_recommendations(request: RecommendationRequest):
             item_latent_matrix, 
             knn, 
             domain,
-            n_recommendations=5
+            n_recommendations=5,
+            fusion=request.fusion
         )
         
         # Convert results to a list of dictionaries
@@ -480,12 +738,16 @@ async def get_anime_recommendations(request: RecommendationRequest):
         # Force domain to be "anime" regardless of what was sent
         domain = "anime"
         df = app.anime_df
+        
+        # Shared catalog artifacts published at startup (None if unavailable)
+        artifacts = get_domain_artifacts(domain)
             
         # Filter the dataset based on user preferences
-        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain)
+        filtered_df = filter_dataset(df, request.mood, request.era, request.genre, domain, get_facet_table(domain))
         
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
+        # Build the model, reusing the shared latent rows when we have them
+        latent_rows = artifacts['latent'][catalog_positions(df, filtered_df)] if artifacts is not None else None
+        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain, latent_rows)
         
         # Get recommendations
         similar_items = find_similar_items(
@@ -495,7 +757,8 @@ async def get_anime_recommendations(request: RecommendationRequest):
             item_latent_matrix, 
             knn, 
             domain,
-            n_recommendations=5
+            n_recommendations=5,
+            fusion=request.fusion
         )
         
         # Convert results to a list of dictionaries
@@ -537,12 +800,16 @@ async def get_movie_recommendations(request: RecommendationRequest):
         # Force domain to be "movie" regardless of what was sent
         domain = "movie"
         df = app.movie_df
+        
+        # Shared catalog artifacts published at startup (None if unavailable)
+        artifacts = get_domain_artifacts(domain)
             
         # Filter the dataset based on user preferences
-        filtered_df = filter_movie_dataset(df, request.mood, request.era, request.genre)
+        filtered_df = filter_movie_dataset(df, request.mood, request.era, request.genre, get_facet_table(domain))
         
-        # Build the model
-        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain)
+        # Build the model, reusing the shared latent rows when we have them
+        latent_rows = artifacts['latent'][catalog_positions(df, filtered_df)] if artifacts is not None else None
+        item_latent_matrix, knn, filtered_df = build_model(filtered_df, domain, latent_rows)
         
         # Get recommendations
         similar_items = find_similar_items(
@@ -552,7 +819,8 @@ async def get_movie_recommendations(request: RecommendationRequest):
             item_latent_matrix, 
             knn, 
             domain,
-            n_recommendations=5
+            n_recommendations=5,
+            fusion=request.fusion
         )
         
         # Convert results to a list of dictionaries
@@ -592,53 +860,36 @@ async def get_recommendations(request: RecommendationRequest):
     else:
         return await get_book_recommendations(request)
 
-def filter_movie_dataset(df, mood, era, genre):
-    """Filter the movie dataset based on user-selected mood, era, and genre."""
-    filtered_df = df.copy()
-    
-    # Step 1: Genre Filtering
-    target_genres = []
-    if genre and genre in movie_genre_mapping:
-        target_genres.append(movie_genre_mapping[genre])
-    
-    if mood and mood in mood_to_movie_genres:
-        target_genres.extend(mood_to_movie_genres[mood])
-    
-    target_genres = list(set(target_genres))  # Remove duplicates
+# Map autocomplete path segments to domains (same names as the recommendation endpoints)
+autocomplete_domains = {
+    'books': 'book',
+    'anime': 'anime',
+    'movies': 'movie'
+}
+
+@app.get("/autocomplete/{domain_path}/")
+async def autocomplete_titles(domain_path: str, q: str = "", limit: int = 10):
+    """Titles starting with q, most-voted first, so clients can submit exact seed titles."""
+    domain = autocomplete_domains.get(domain_path)
+    if domain is None:
+        raise HTTPException(status_code=404, detail=f"Unknown domain: {domain_path}")
     
-    if target_genres:
-        genre_filter = filtered_df['genre'].apply(
-            lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-        )
-        filtered_df = filtered_df[genre_filter]
+    prefix = q.lower().strip()
+    title_index = get_title_index(domain)
+    if not prefix or title_index is None:
+        return {"titles": [], "domain": domain}
     
-    # Step 2: Era Filtering
-    if era and era != 'any':
-        if era in era_to_movie_years and era_to_movie_years[era]:
-            start_year, end_year = era_to_movie_years[era]
-            year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
-            filtered_df = filtered_df[year_filter]
-    
-    # If we filtered too aggressively, return a broader dataset
-    print(len(filtered_df))
-    if len(filtered_df) < 1:
-        print(f"Warning: Too few movies match filters. Using broader dataset.")
-        
-        # Try just using the genre filter if era was specified
-        if era and era != 'any' and target_genres:
-            filtered_by_genre = df.copy()
-            genre_filter = filtered_by_genre['genre'].apply(
-                lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-            )
-            filtered_by_genre = filtered_by_genre[genre_filter]
-            
-            if len(filtered_by_genre) >= 10:
-                return filtered_by_genre
-        
-        # If still not enough, return most popular items
-        return df.sort_values('num_votes', ascending=False).head(100)
+    limit = max(1, min(limit, 50))
+    df = getattr(app, f"{domain}_df")
+    titles = []
+    for row in search_title_prefix(title_index, prefix, limit):
+        item = df.iloc[row]
+        titles.append({
+            'id': str(item.get('item_id', '')),
+            'title': item.get('title', 'Unknown Title'),
+        })
     
-    return filtered_df
+    return {"titles": titles, "domain": domain}
 
 @app.on_event("startup")
 async def startup_movie_db():
@@ -753,32 +1004,59 @@ async def startup_movie_db():
                    'https://m.media-amazon.com/images/M/MV5BM2MyNjYxNmUtYTAwNi00MTYxLWJmNWYtYzZlODY3ZTk3OTFlXkEyXkFqcGdeQXVyNzkwMjQ5NzM@._V1_SX300.jpg']
         })
 
-def filter_movie_dataset(df, mood, era, genre):
-    """Filter the movie dataset based on user-selected mood, era, and genre."""
-    filtered_df = df.copy()
-    
-    # Step 1: Genre Filtering
-    target_genres = []
-    if genre and genre in movie_genre_mapping:
-        target_genres.append(movie_genre_mapping[genre])
-    
-    if mood and mood in mood_to_movie_genres:
-        target_genres.extend(mood_to_movie_genres[mood])
-    
-    target_genres = list(set(target_genres))  # Remove duplicates
-    
-    if target_genres:
-        genre_filter = filtered_df['genre'].apply(
-            lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-        )
-        filtered_df = filtered_df[genre_filter]
+@app.on_event("startup")
+async def startup_artifacts():
+    """Publish (or attach to) the shared per-domain artifacts once the catalogs are loaded."""
+    app.artifact_versions = {}
+    app.title_indexes = {}
+    shared = os.environ.get('MEDIAMATCHR_SHARED_ARTIFACTS', '1') != '0'
+    if not shared:
+        print("Shared artifacts disabled, models will be built per request")
     
-    # Step 2: Era Filtering
-    if era and era != 'any':
-        if era in era_to_movie_years and era_to_movie_years[era]:
-            start_year, end_year = era_to_movie_years[era]
-            year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
-            filtered_df = filtered_df[year_filter]
+    for domain in ['book', 'anime', 'movie']:
+        df = getattr(app, f"{domain}_df", None)
+        if df is None:
+            continue
+        if not shared:
+            # Typeahead still needs a title index, so keep a private one for this worker
+            app.title_indexes[domain] = build_title_index(df)
+            continue
+        try:
+            genre_col = 'genres' if domain == 'book' else 'genre'
+            version = catalog_version(df, ['title', genre_col, 'avg_rating', 'num_votes'])
+            load_or_build_artifacts(domain, version, lambda: build_catalog_artifacts(df, domain))
+            app.artifact_versions[domain] = version
+            print(f"Attached to {domain} artifacts {version}")
+        except Exception as e:
+            print(f"Error preparing {domain} artifacts: {e}")
+            app.title_indexes[domain] = build_title_index(df)
+
+@app.on_event("startup")
+async def startup_facets():
+    """Load the rule tables and compile them into facet tables for every domain."""
+    rule_tables.refresh()
+    compile_all_facets()
+
+def filter_movie_dataset(df, mood, era, genre, facets=None):
+    """Filter the movie dataset based on user-selected mood, era, and genre."""
+    if facets is not None:
+        # Precompiled facet columns resolve mood, era and genre with a single mask lookup
+        mask = facets.mask(mood, era, genre)
+        filtered_df = df if mask is None else df[mask]
+    else:
+        filtered_df = df.copy()
+        target_genres = movie_target_genres(mood, genre)
+        
+        # Step 1: Genre Filtering
+        if target_genres:
+            filtered_df = filtered_df[movie_genre_filter(filtered_df, target_genres)]
+        
+        # Step 2: Era Filtering
+        if era and era != 'any':
+            if era in era_to_movie_years and era_to_movie_years[era]:
+                start_year, end_year = era_to_movie_years[era]
+                year_filter = (filtered_df['year'] >= start_year) & (filtered_df['year'] < end_year)
+                filtered_df = filtered_df[year_filter]
     
     # If we filtered too aggressively, return a broader dataset
     print(len(filtered_df))
@@ -786,21 +1064,39 @@ def filter_movie_dataset(df, mood, era, genre):
         print(f"Warning: Too few movies match filters. Using broader dataset.")
         
         # Try just using the genre filter if era was specified
-        if era and era != 'any' and target_genres:
-            filtered_by_genre = df.copy()
-            genre_filter = filtered_by_genre['genre'].apply(
-                lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
-            )
-            filtered_by_genre = filtered_by_genre[genre_filter]
+        if era and era != 'any':
+            if facets is not None:
+                genre_filter = facets.genre_mask(mood, genre)
+            else:
+                target_genres = movie_target_genres(mood, genre)
+                genre_filter = movie_genre_filter(df, target_genres) if target_genres else None
             
-            if len(filtered_by_genre) >= 10:
-                return filtered_by_genre
+            if genre_filter is not None:
+                filtered_by_genre = df[genre_filter]
+                if len(filtered_by_genre) >= 10:
+                    return filtered_by_genre
         
         # If still not enough, return most popular items
         return df.sort_values('num_votes', ascending=False).head(100)
     
     return filtered_df
 
+def movie_target_genres(mood, genre):
+    """Genres selected by the frontend genre and the mood for movies."""
+    target_genres = []
+    if genre and genre in movie_genre_mapping:
+        target_genres.append(movie_genre_mapping[genre])
+    
+    if mood and mood in mood_to_movie_genres:
+        target_genres.extend(mood_to_movie_genres[mood])
+    
+    return list(set(target_genres))  # Remove duplicates
+
+def movie_genre_filter(df, target_genres):
+    return df['genre'].apply(
+        lambda x: any(g in str(x).split(',') for g in target_genres) if pd.notna(x) else False
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,193 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; builds are then not serialized across workers
+    fcntl = None
+
+# Bump when the layout or meaning of the stored arrays changes
+ARTIFACT_SCHEMA = 3
+
+# How many published versions to keep per domain (older ones are pruned)
+ARTIFACT_KEEP_VERSIONS = 2
+
+# Per-process cache of attached artifact sets, keyed by (domain, version)
+_attached = {}
+
+
+def artifact_root():
+    """Directory that holds the published artifact sets for every domain."""
+    root = os.environ.get('MEDIAMATCHR_ARTIFACT_DIR')
+    if root:
+        return root
+    # /dev/shm is a tmpfs, so memory-mapped files there are plain shared memory
+    if os.path.isdir('/dev/shm'):
+        return os.path.join('/dev/shm', 'mediamatchr')
+    return os.path.join(tempfile.gettempdir(), 'mediamatchr')
+
+
+def catalog_version(df, columns):
+    """Content hash of the catalog columns an artifact set is built from."""
+    digest = hashlib.sha1(f"schema={ARTIFACT_SCHEMA}".encode())
+    present = [c for c in columns if c in df.columns]
+    digest.update(','.join(present).encode())
+    digest.update(pd.util.hash_pandas_object(df[present], index=True).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ArtifactSet:
+    """Read-only view of one published artifact version for a domain."""
+
+    def __init__(self, domain, version, path, arrays):
+        self.domain = domain
+        self.version = version
+        self.path = path
+        self.arrays = arrays
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+
+def _domain_dir(domain):
+    return os.path.join(artifact_root(), domain)
+
+
+def _current_file(domain):
+    return os.path.join(_domain_dir(domain), 'CURRENT')
+
+
+def _read_current(domain):
+    try:
+        with open(_current_file(domain)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _load_version(domain, version):
+    path = os.path.join(_domain_dir(domain), version)
+    if not os.path.isdir(path):
+        return None
+    arrays = {}
+    for name in os.listdir(path):
+        if name.endswith('.npy'):
+            arrays[name[:-4]] = np.load(os.path.join(path, name), mmap_mode='r')
+    return ArtifactSet(domain, version, path, arrays)
+
+
+def publish_artifacts(domain, version, arrays):
+    """Write arrays as a new version and atomically make it the current one."""
+    domain_dir = _domain_dir(domain)
+    os.makedirs(domain_dir, exist_ok=True)
+    final_path = os.path.join(domain_dir, version)
+
+    if not os.path.isdir(final_path):
+        # Stage into a private directory first so readers never see a partial set
+        staging = tempfile.mkdtemp(prefix=f".{version}-", dir=domain_dir)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+            os.rename(staging, final_path)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(final_path):
+                raise
+
+    # Swap the CURRENT pointer with a rename, which is atomic on POSIX
+    pointer_tmp = os.path.join(domain_dir, f".CURRENT-{os.getpid()}")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, _current_file(domain))
+
+    _prune_versions(domain, keep=version)
+    return _load_version(domain, version)
+
+
+def _prune_versions(domain, keep):
+    """Drop old versions; workers that still map them keep their pages until they detach."""
+    domain_dir = _domain_dir(domain)
+    versions = []
+    for name in os.listdir(domain_dir):
+        path = os.path.join(domain_dir, name)
+        if name.startswith('.') or name == keep or not os.path.isdir(path):
+            continue
+        versions.append((os.path.getmtime(path), path))
+    versions.sort(reverse=True)
+    for _, path in versions[ARTIFACT_KEEP_VERSIONS - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _remove_stale_staging(domain_dir):
+    """Remove staging directories left behind by builds that crashed before publishing."""
+    for name in os.listdir(domain_dir):
+        path = os.path.join(domain_dir, name)
+        if name.startswith('.') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_or_build_artifacts(domain, version, build_fn):
+    """Attach to the given artifact version, building and publishing it if no worker has yet.
+
+    The returned set stays attached for the life of the process, so its memory maps
+    survive even if a later rebuild prunes the version's files.
+    """
+    artifacts = _load_or_build(domain, version, build_fn)
+    if artifacts is not None:
+        _attached[(domain, version)] = artifacts
+    return artifacts
+
+
+def _load_or_build(domain, version, build_fn):
+    existing = _load_version(domain, version)
+    if existing is not None and _read_current(domain) == version:
+        return existing
+
+    domain_dir = _domain_dir(domain)
+    os.makedirs(domain_dir, exist_ok=True)
+    with open(os.path.join(domain_dir, '.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Staging directories are only written under this lock, so any left now are stale
+            _remove_stale_staging(domain_dir)
+
+            # Another worker may have finished the build while we waited on the lock
+            existing = _load_version(domain, version)
+            if existing is not None:
+                return publish_artifacts(domain, version, {})
+
+            start = time.time()
+            arrays = build_fn()
+            artifacts = publish_artifacts(domain, version, arrays)
+            print(f"Published {domain} artifacts {version} in {time.time() - start:.2f}s")
+            return artifacts
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_artifacts(domain, version=None):
+    """Return an attached artifact set for a domain.
+
+    With no version this follows CURRENT, re-attaching when a newer set is published.
+    Passing the caller's catalog version pins it to arrays that line up with its rows.
+    """
+    version = version or _read_current(domain)
+    if version is None:
+        return None
+    cached = _attached.get((domain, version))
+    if cached is not None:
+        return cached
+    artifacts = _load_version(domain, version)
+    if artifacts is not None:
+        _attached[(domain, version)] = artifacts
+    return artifacts
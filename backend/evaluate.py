@@ -0,0 +1,444 @@
+"""Offline evaluation of the recommender: precision@k, recall@k, coverage and latency.
+
+Each query is a user's preference list split into seed titles (what they would
+type in) and held-out titles (what we hope to recommend). Queries come from a
+JSON-lines file with one object per line:
+
+    {"domain": "movie", "seeds": ["The Godfather"], "held_out": ["Goodfellas", "Casino"]}
+
+or are synthesized from the catalogs (genre-coherent users weighted by num_votes).
+
+Every combination of domain, SVD rank, latent mode, search mode and filter mode
+is one configuration. Configurations run on a process pool; inside a worker
+queries are scored in vectorized batches. Latent mode "shared" slices rows of the
+full-catalog SVD by the filtered items, as the API does with its shared
+artifacts; "subset" refits SVD on each filtered subset, as the API does when
+shared artifacts are disabled. Search mode "exact" is the cosine ranking the API
+uses; "ann" is an inverted-file index that only scores the closest clusters.
+
+Quality is scored in batches, so batch_ms_per_query is amortized scoring time
+only. The api_* columns time --timed-queries queries one at a time the way the
+API serves them: the per-request model fit (SVD refit in subset mode, plus the
+nearest-neighbour index) and then the search, with p50/p95 of their sum.
+
+    python evaluate.py --synthesize 20000 --ranks 10,25,50 --search exact,ann \\
+        --filters none mood=light era=modern
+    python evaluate.py --queries held_out.jsonl --domains movie --k 5 10
+"""
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+import app as api
+
+# Catalogs and resolved queries, set once per worker process by _init_worker
+_catalogs = None
+_queries = None
+
+# Full-catalog latent matrices per (domain, rank), computed once per worker process
+_shared_latents = {}
+
+
+def load_catalogs():
+    """Load the catalogs and the rule tables (with any facets.json overrides) the same way the API does at startup."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(api.startup_db_client())
+        asyncio.run(api.startup_movie_db())
+        api.rule_tables.refresh()
+    return {domain: getattr(api.app, f"{domain}_df").reset_index(drop=True) for domain in ['book', 'anime', 'movie']}
+
+
+def normalize_title(title):
+    return str(title).lower().strip()
+
+
+def title_positions(df):
+    """Map each normalized title to the position of its first row in the catalog."""
+    keys = df['title'].fillna('').map(normalize_title)
+    first = ~keys.duplicated()
+    return dict(zip(keys[first], np.flatnonzero(first.to_numpy())))
+
+
+def load_queries(path):
+    """Read held-out preference lists from a JSON-lines file."""
+    queries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                row = json.loads(line)
+                queries.append({'domain': row['domain'], 'seeds': row['seeds'], 'held_out': row['held_out']})
+    return queries
+
+
+def synthesize_queries(df, domain, n_queries, rng, max_seeds=3, max_held_out=10):
+    """Sample genre-coherent users: seeds and held-out titles share the genres of an anchor item."""
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    genre_lists = df[genre_col].fillna('').astype(str).str.split(',')
+    popularity = df['num_votes'].fillna(0).to_numpy(dtype=float) + 1 if 'num_votes' in df.columns else np.ones(len(df))
+    popularity /= popularity.sum()
+
+    # Items grouped by genre, so a user's candidate pool is an intersection of small sets
+    items_by_genre = {}
+    for row, genres in enumerate(genre_lists):
+        for g in genres:
+            items_by_genre.setdefault(g, []).append(row)
+    items_by_genre = {g: np.array(rows) for g, rows in items_by_genre.items()}
+
+    titles = df['title'].astype(str).to_numpy()
+    anchors = rng.choice(len(df), size=n_queries, p=popularity)
+    pools = {}
+    queries = []
+    for anchor in anchors:
+        genres = genre_lists.iloc[anchor]
+        picked = tuple(sorted(rng.choice(genres, size=min(2, len(genres)), replace=False)))
+        if picked not in pools:
+            pool = items_by_genre[picked[0]]
+            for g in picked[1:]:
+                pool = np.intersect1d(pool, items_by_genre[g], assume_unique=True)
+            pools[picked] = pool
+        pool = pools[picked]
+        n_seeds = rng.integers(1, max_seeds + 1)
+        if len(pool) < n_seeds + 2:
+            continue
+        n_held_out = min(max_held_out, len(pool) - n_seeds)
+        weights = popularity[pool] / popularity[pool].sum()
+        chosen = rng.choice(pool, size=n_seeds + n_held_out, replace=False, p=weights)
+        queries.append({
+            'domain': domain,
+            'seeds': titles[chosen[:n_seeds]].tolist(),
+            'held_out': titles[chosen[n_seeds:]].tolist(),
+        })
+    return queries
+
+
+def resolve_queries(queries, catalogs):
+    """Turn title lists into catalog positions, dropping queries with nothing to seed or score."""
+    resolved = {}
+    skipped = {}
+    lookups = {}
+    for q in queries:
+        domain = q['domain']
+        if domain not in catalogs:
+            continue
+        if domain not in lookups:
+            lookups[domain] = title_positions(catalogs[domain])
+        lookup = lookups[domain]
+        seeds = [lookup[t] for t in map(normalize_title, q['seeds']) if t in lookup]
+        held_out = [lookup[t] for t in map(normalize_title, q['held_out']) if t in lookup]
+        held_out = sorted(set(held_out) - set(seeds))
+        if not seeds or not held_out:
+            skipped[domain] = skipped.get(domain, 0) + 1
+            continue
+        resolved.setdefault(domain, []).append((np.array(seeds), np.array(held_out)))
+    return resolved, skipped
+
+
+def parse_filter_mode(spec):
+    """'none' or 'mood=light+era=modern' into keyword filters."""
+    filters = {'mood': None, 'era': None, 'genre': None}
+    if spec != 'none':
+        for part in spec.split('+'):
+            key, _, value = part.partition('=')
+            if key not in filters:
+                raise ValueError(f"Unknown filter in mode {spec!r}: {key}")
+            filters[key] = value
+    return filters
+
+
+def filtered_positions(df, domain, filter_mode):
+    """Catalog positions that survive the API's filters for this mode."""
+    filters = parse_filter_mode(filter_mode)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if domain == 'movie':
+            filtered_df = api.filter_movie_dataset(df, filters['mood'], filters['era'], filters['genre'])
+        else:
+            filtered_df = api.filter_dataset(df, filters['mood'], filters['era'], filters['genre'], domain)
+    return df.index.get_indexer(filtered_df.index)
+
+
+class IVFIndex:
+    """Inverted-file ANN index: items bucketed by k-means cluster, queries probe the closest buckets."""
+
+    def __init__(self, vectors, n_clusters, n_probe, seed=0):
+        n_clusters = max(1, min(n_clusters, len(vectors)))
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3).fit(vectors)
+        centroids = kmeans.cluster_centers_
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = (centroids / np.where(norms == 0, 1, norms)).astype(np.float32)
+        # Store items sorted by cluster so each bucket is one contiguous slice
+        self.order = np.argsort(kmeans.labels_, kind='stable')
+        self.vectors = vectors[self.order]
+        self.offsets = np.searchsorted(kmeans.labels_[self.order], np.arange(n_clusters + 1))
+        self.n_probe = min(n_probe, n_clusters)
+
+    def search(self, queries, exclude, k):
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.n_probe]
+        results = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, clusters) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters])
+            items = self.order[candidates]
+            scores = self.vectors[candidates] @ query
+            scores[np.isin(items, exclude[row])] = -np.inf
+            top = _top_k(scores[None, :], k)[0]
+            top = top[np.isfinite(scores[top])] if len(top) else top
+            results[row, :len(top)] = items[top]
+        return results
+
+
+def _top_k(scores, k):
+    """Indices of the k best scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def exact_search(queries, vectors, exclude, k):
+    """Batched cosine search over all items; exclude holds padded item ids (-1 = none)."""
+    scores = queries @ vectors.T
+    rows = np.repeat(np.arange(len(queries)), exclude.shape[1])
+    cols = exclude.ravel()
+    keep = cols >= 0
+    scores[rows[keep], cols[keep]] = -np.inf
+    top = _top_k(scores, k)
+    top[~np.isfinite(np.take_along_axis(scores, top, axis=1))] = -1
+    results = np.full((len(queries), k), -1, dtype=np.int64)
+    results[:, :top.shape[1]] = top
+    return results
+
+
+def _pad(arrays, fill):
+    width = max((len(a) for a in arrays), default=0)
+    out = np.full((len(arrays), max(width, 1)), fill, dtype=np.int64)
+    for row, a in enumerate(arrays):
+        out[row, :len(a)] = a
+    return out
+
+
+def shared_latent(domain, rank):
+    """Full-catalog latent matrix, the same one the API publishes in its shared artifacts."""
+    if (domain, rank) not in _shared_latents:
+        df = _catalogs[domain]
+        _shared_latents[(domain, rank)] = api.compute_latent_matrix(df, domain, rank=rank).astype(np.float32)
+    return _shared_latents[(domain, rank)]
+
+
+def build_latent(df, domain, rank, latent_mode, positions):
+    """Latent rows for the filtered items, as the API gets them for one request."""
+    if latent_mode == 'subset':
+        return api.compute_latent_matrix(df.iloc[positions], domain, rank=rank).astype(np.float32)
+    return shared_latent(domain, rank)[positions]
+
+
+def time_api_queries(df, domain, rank, latent_mode, search, positions, seed_lists, k, ann_clusters, ann_probe):
+    """Per-query (fit, search) seconds for queries served one at a time, rebuilding the model like the API."""
+    filtered_df = df.iloc[positions]
+    timings = []
+    for seeds in seed_lists:
+        fit_start = time.perf_counter()
+        latent = build_latent(df, domain, rank, latent_mode, positions)
+        if search == 'ann':
+            norms = np.linalg.norm(latent, axis=1, keepdims=True)
+            vectors = latent / np.where(norms == 0, 1, norms)
+            index = IVFIndex(vectors, ann_clusters or int(np.sqrt(len(vectors))) or 1, ann_probe)
+        else:
+            latent, knn, _ = api.build_model(filtered_df, domain, latent)
+        query_start = time.perf_counter()
+        query = latent[seeds].mean(axis=0).reshape(1, -1)
+        if search == 'ann':
+            query /= np.linalg.norm(query) or 1
+            index.search(query.astype(np.float32), seeds[None, :], k)
+        else:
+            knn.kneighbors(query, n_neighbors=min(k + len(seeds), len(latent)))
+        end = time.perf_counter()
+        timings.append((query_start - fit_start, end - query_start))
+    return np.array(timings).reshape(-1, 2)
+
+
+def _init_worker(catalogs, queries):
+    global _catalogs, _queries
+    _catalogs = catalogs
+    _queries = queries
+    # Spawned workers re-import app with the default rules, so apply the overrides here too
+    with contextlib.redirect_stdout(io.StringIO()):
+        api.rule_tables.refresh()
+
+
+def evaluate_config(config):
+    """Evaluate one (domain, rank, latent, search, filter) configuration on every query of its domain."""
+    domain, rank, latent_mode, search, filter_mode, ks, batch_size, ann_clusters, ann_probe, timed_queries = config
+    df = _catalogs[domain]
+    queries = _queries.get(domain, [])
+    max_k = max(ks)
+
+    build_start = time.perf_counter()
+    positions = filtered_positions(df, domain, filter_mode)
+    latent = build_latent(df, domain, rank, latent_mode, positions)
+    norms = np.linalg.norm(latent, axis=1, keepdims=True)
+    vectors = latent / np.where(norms == 0, 1, norms)
+    index = None
+    if search == 'ann':
+        n_clusters = ann_clusters or int(np.sqrt(len(vectors))) or 1
+        index = IVFIndex(vectors, n_clusters, ann_probe)
+    build_s = time.perf_counter() - build_start
+
+    # Full-catalog position -> position in the filtered subset (-1 if filtered out)
+    subset_of = np.full(len(df), -1, dtype=np.int64)
+    subset_of[positions] = np.arange(len(positions))
+    popular = np.argsort(-df['num_votes'].fillna(0).to_numpy(), kind='stable')[:max_k + 10]
+
+    hits = {k: [] for k in ks}
+    relevant_counts = []
+    recommended = set()
+    batch_seconds = 0.0
+    fallbacks = 0
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        batch_start = time.perf_counter()
+
+        seeds = [subset_of[s] for s, _ in batch]
+        seeds = [s[s >= 0] for s in seeds]
+        has_seed = np.array([len(s) > 0 for s in seeds])
+        recs = np.full((len(batch), max_k), -1, dtype=np.int64)
+
+        if has_seed.any():
+            seed_lists = [s for s, ok in zip(seeds, has_seed) if ok]
+            # Same aggregation as the API: the mean latent vector of the seeds
+            query_vectors = np.stack([latent[s].mean(axis=0) for s in seed_lists])
+            q_norms = np.linalg.norm(query_vectors, axis=1, keepdims=True)
+            query_vectors /= np.where(q_norms == 0, 1, q_norms)
+            exclude = _pad(seed_lists, -1)
+            if index is not None:
+                found = index.search(query_vectors, exclude, max_k)
+            else:
+                found = exact_search(query_vectors, vectors, exclude, max_k)
+            recs[has_seed] = np.where(found >= 0, positions[np.maximum(found, 0)], -1)
+
+        # Queries whose seeds were all filtered out get the API's popular-items fallback
+        if (~has_seed).any():
+            fallbacks += int((~has_seed).sum())
+            recs[~has_seed] = popular[:max_k]
+
+        batch_seconds += time.perf_counter() - batch_start
+
+        relevant = _pad([h for _, h in batch], -2)
+        matches = (recs[:, :, None] == relevant[:, None, :]).any(axis=2)
+        for k in ks:
+            hits[k].append(matches[:, :k].sum(axis=1))
+        relevant_counts.append(np.array([len(h) for _, h in batch]))
+        recommended.update(recs[recs >= 0].ravel().tolist())
+
+    result = {
+        'domain': domain, 'rank': rank, 'latent': latent_mode, 'search': search, 'filter': filter_mode,
+        'queries': len(queries), 'filtered_items': int(len(positions)),
+        'build_s': round(build_s, 3), 'fallback_queries': fallbacks,
+        'coverage': len(recommended) / len(df) if len(df) else 0.0,
+    }
+    if queries:
+        counts = np.concatenate(relevant_counts)
+        for k in ks:
+            k_hits = np.concatenate(hits[k])
+            result[f'precision@{k}'] = float((k_hits / k).mean())
+            result[f'recall@{k}'] = float((k_hits / counts).mean())
+        # Scoring time of the vectorized batches spread over their queries; not a per-query latency
+        result['batch_ms_per_query'] = batch_seconds * 1000 / len(queries)
+
+    # Latency as the API sees it: each query on its own, with the per-request model fit
+    seed_lists = [s[s >= 0] for s in (subset_of[s] for s, _ in queries[:timed_queries])]
+    seed_lists = [s for s in seed_lists if len(s)]
+    if seed_lists:
+        timings_ms = time_api_queries(df, domain, rank, latent_mode, search, positions, seed_lists,
+                                      max_k, ann_clusters, ann_probe) * 1000
+        totals_ms = timings_ms.sum(axis=1)
+        result['api_queries_timed'] = len(seed_lists)
+        result['api_fit_ms_mean'] = float(timings_ms[:, 0].mean())
+        result['api_query_ms_mean'] = float(timings_ms[:, 1].mean())
+        result['api_ms_p50'], result['api_ms_p95'] = map(float, np.percentile(totals_ms, [50, 95]))
+    return result
+
+
+def print_report(results, ks):
+    columns = ['domain', 'rank', 'latent', 'search', 'filter', 'queries']
+    columns += [f'{m}@{k}' for k in ks for m in ('precision', 'recall')]
+    columns += ['coverage', 'batch_ms_per_query', 'api_fit_ms_mean', 'api_query_ms_mean', 'api_ms_p50', 'api_ms_p95', 'build_s']
+    report = pd.DataFrame(results).reindex(columns=columns)
+    with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.4f}'.format):
+        print(report.to_string(index=False))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation of recommendation quality and latency.")
+    parser.add_argument('--queries', help="JSON-lines file of held-out preference lists")
+    parser.add_argument('--synthesize', type=int, default=2000, help="Synthetic queries per domain when no file is given")
+    parser.add_argument('--domains', default='book,anime,movie', help="Comma-separated domains to evaluate")
+    parser.add_argument('--k', type=int, nargs='+', default=[5], help="Cutoffs for precision/recall")
+    parser.add_argument('--ranks', default='50', help="Comma-separated SVD ranks")
+    parser.add_argument('--latent', default='shared',
+                        help="Comma-separated latent modes: shared (full-catalog SVD), subset (SVD per filtered subset)")
+    parser.add_argument('--search', default='exact', help="Comma-separated search modes: exact, ann")
+    parser.add_argument('--filters', nargs='+', default=['none'], help="Filter modes, e.g. none mood=light era=modern+genre=drama")
+    parser.add_argument('--ann-clusters', type=int, default=0, help="IVF clusters (default sqrt of the catalog size)")
+    parser.add_argument('--ann-probe', type=int, default=8, help="IVF clusters probed per query")
+    parser.add_argument('--batch-size', type=int, default=512, help="Queries scored per vectorized batch")
+    parser.add_argument('--timed-queries', type=int, default=50,
+                        help="Queries per configuration timed one at a time with the API's per-request fit")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Process pool size")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for synthetic queries")
+    parser.add_argument('--output-dir', default='eval_results', help="Directory for the saved report")
+    args = parser.parse_args()
+
+    domains = [d.strip() for d in args.domains.split(',') if d.strip()]
+    catalogs = {d: df for d, df in load_catalogs().items() if d in domains}
+
+    if args.queries:
+        queries = load_queries(args.queries)
+    else:
+        rng = np.random.default_rng(args.seed)
+        queries = []
+        for domain, df in catalogs.items():
+            queries.extend(synthesize_queries(df, domain, args.synthesize, rng))
+    resolved, skipped = resolve_queries(queries, catalogs)
+    for domain in domains:
+        print(f"{domain}: {len(resolved.get(domain, []))} queries ({skipped.get(domain, 0)} skipped, no matching titles)")
+
+    configs = [
+        (domain, int(rank), latent_mode, search, filter_mode, args.k, args.batch_size, args.ann_clusters, args.ann_probe,
+         args.timed_queries)
+        for domain, rank, latent_mode, search, filter_mode in itertools.product(
+            domains, args.ranks.split(','), args.latent.split(','), args.search.split(','), args.filters
+        )
+        if resolved.get(domain)
+    ]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(catalogs, resolved)) as pool:
+        results = list(pool.map(evaluate_config, configs))
+    print(f"Evaluated {len(configs)} configurations in {time.perf_counter() - start:.1f}s")
+
+    report = print_report(results, args.k)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, datetime.now().strftime('eval-%Y%m%d-%H%M%S'))
+    report.to_csv(f"{path}.csv", index=False)
+    with open(f"{path}.json", 'w') as f:
+        json.dump({'config': vars(args), 'skipped': skipped, 'results': results}, f, indent=2)
+    print(f"Saved report to {path}.csv")
+
+
+if __name__ == "__main__":
+    main()
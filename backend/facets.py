@@ -0,0 +1,213 @@
+"""Mood/era/genre facet tables compiled from the rule dicts in app.py.
+
+Each item gets one small integer per facet whose bits say which moods, eras and
+frontend genres it belongs to. A request's filters then become a couple of
+bitwise ANDs over the catalog instead of per-row genre string matching.
+
+The rule dicts can be overridden from a JSON file (MEDIAMATCHR_FACETS_PATH,
+default backend/facets.json) keyed by the dict names in app.py, for example:
+
+    {
+        "mood_to_movie_genres": {"light": ["Comedy", "Family", "Animation"]},
+        "era_to_movie_years": {"classic": [1900, 1960], "any": null}
+    }
+
+A table present in the file replaces the default one; the file is re-read when
+its modification time changes, so edits apply without restarting workers.
+"""
+import os
+import copy
+import json
+import numpy as np
+
+# Sentinel so the first refresh always loads, even when there is no config file
+_NOT_LOADED = object()
+
+
+def build_genre_bits(df, genre_col):
+    """Genre vocabulary and per-item genre membership packed into bytes."""
+    genre_lists = df[genre_col].apply(lambda x: str(x).split(','))
+    genre_vocab = sorted(set(g for genres in genre_lists for g in genres))
+    vocab_index = {g: i for i, g in enumerate(genre_vocab)}
+    genre_onehot = np.zeros((len(df), len(genre_vocab)), dtype=bool)
+    for row, genres in enumerate(genre_lists):
+        genre_onehot[row, [vocab_index[g] for g in genres]] = True
+    return np.array(genre_vocab, dtype=str), np.packbits(genre_onehot, axis=1)
+
+
+def genre_bits_mask(genre_vocab, genre_bits, target_genres):
+    """Boolean mask of items tagged with any of the target genres."""
+    packed_target = np.packbits(np.isin(genre_vocab, list(target_genres)))
+    return (genre_bits & packed_target).any(axis=1)
+
+
+def _bit_dtype(n_values):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_values <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Too many facet values for a bitmap: {n_values}")
+
+
+class FacetTable:
+    """Per-item mood, era and genre bitmaps for one domain."""
+
+    def __init__(self, moods, eras, genres, mood_bits, era_bits, genre_bits):
+        # Value name -> bit position, for each facet
+        self.moods = {name: i for i, name in enumerate(moods)}
+        self.eras = {name: i for i, name in enumerate(eras)}
+        self.genres = {name: i for i, name in enumerate(genres)}
+        self.mood_bits = mood_bits
+        self.era_bits = era_bits
+        self.genre_bits = genre_bits
+
+    @property
+    def n_items(self):
+        return len(self.mood_bits)
+
+    def genre_mask(self, mood=None, genre=None):
+        """Items in the mood's genres or the selected genre (the two are combined with OR), or None."""
+        masks = []
+        if mood in self.moods:
+            masks.append((self.mood_bits >> self.moods[mood]) & 1)
+        if genre in self.genres:
+            masks.append((self.genre_bits >> self.genres[genre]) & 1)
+        if not masks:
+            return None
+        return np.bitwise_or.reduce(masks).astype(bool)
+
+    def era_mask(self, era=None):
+        """Items in the selected era, or None when the era does not filter."""
+        if era not in self.eras:
+            return None
+        return ((self.era_bits >> self.eras[era]) & 1).astype(bool)
+
+    def mask(self, mood=None, era=None, genre=None):
+        """Combined filter mask, or None when nothing filters."""
+        genre_mask = self.genre_mask(mood, genre)
+        era_mask = self.era_mask(era)
+        if genre_mask is None:
+            return era_mask
+        if era_mask is None:
+            return genre_mask
+        return genre_mask & era_mask
+
+
+def compile_facets(df, mood_rules, era_rules, genre_rules, genre_vocab, genre_bits, era_year_column=None):
+    """Compile a domain's rule dicts into a FacetTable.
+
+    era_rules map to genre proxies, or to (start, end) year ranges over era_year_column.
+    Values with no rule (None or empty) are left out, so they do not filter.
+    """
+    def membership(names, targets_of):
+        dtype = _bit_dtype(len(names))
+        bits = np.zeros(len(df), dtype=dtype)
+        for i, name in enumerate(names):
+            member = genre_bits_mask(genre_vocab, genre_bits, targets_of(name))
+            bits |= member.astype(dtype) << dtype(i)
+        return bits
+
+    moods = [m for m, genres in mood_rules.items() if genres]
+    genres = [g for g, target in genre_rules.items() if target]
+    eras = [e for e, rule in era_rules.items() if rule]
+
+    mood_bits = membership(moods, lambda m: mood_rules[m])
+    genre_bits_table = membership(genres, lambda g: [genre_rules[g]])
+
+    if era_year_column is None:
+        era_bits = membership(eras, lambda e: era_rules[e])
+    else:
+        dtype = _bit_dtype(len(eras))
+        era_bits = np.zeros(len(df), dtype=dtype)
+        if era_year_column in df.columns:
+            years = df[era_year_column].to_numpy(dtype=float, na_value=np.nan)
+            for i, era in enumerate(eras):
+                start_year, end_year = era_rules[era]
+                member = (years >= start_year) & (years < end_year)
+                era_bits |= member.astype(dtype) << dtype(i)
+
+    return FacetTable(moods, eras, genres, mood_bits, era_bits, genre_bits_table)
+
+
+class RuleTables:
+    """Named rule dicts, reset to their defaults and overlaid from a JSON file whenever it changes.
+
+    Each table is registered with its kind: 'genres' (lists of genre strings), 'genre'
+    (one genre string) or 'years' ((start, end) ranges). The whole file is validated
+    before anything is swapped in, and the dicts are updated in place so every module
+    holding a reference sees the new rules.
+    """
+
+    def __init__(self, tables, path):
+        self.tables = {name: table for name, (table, _) in tables.items()}
+        self.kinds = {name: kind for name, (_, kind) in tables.items()}
+        self.defaults = copy.deepcopy(self.tables)
+        self.path = path
+        self._mtime = _NOT_LOADED
+
+    def refresh(self):
+        """Re-read the config file if it changed; return True when the rules were reloaded.
+
+        An unreadable or invalid file keeps the current rules and is retried on the next call.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+
+        overrides = {}
+        try:
+            if mtime is not None:
+                with open(self.path) as f:
+                    overrides = json.load(f)
+                if not isinstance(overrides, dict):
+                    raise ValueError("expected an object keyed by rule table name")
+            new_tables = {
+                name: _validate_table(name, overrides[name], self.kinds[name]) if name in overrides
+                else copy.deepcopy(self.defaults[name])
+                for name in self.tables
+            }
+        except (OSError, ValueError) as e:
+            print(f"Error reading rule tables from {self.path}, keeping current rules: {e}")
+            return False
+
+        for name in set(overrides) - set(self.tables):
+            print(f"Ignoring unknown rule table in {self.path}: {name}")
+
+        for name, table in self.tables.items():
+            table.clear()
+            table.update(new_tables[name])
+        self._mtime = mtime
+        print(f"Loaded rule tables ({len(overrides)} overridden from {self.path})")
+        return True
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_table(name, table, kind):
+    """Check one overridden table against its kind and convert it to the in-memory form."""
+    if not isinstance(table, dict):
+        raise ValueError(f"{name} must be an object")
+    validated = {}
+    for key, value in table.items():
+        if value is None:
+            validated[key] = None
+        elif kind == 'genres':
+            if not isinstance(value, list) or not all(isinstance(g, str) for g in value):
+                raise ValueError(f"{name}[{key!r}] must be a list of genre strings or null")
+            validated[key] = list(value)
+        elif kind == 'genre':
+            if not isinstance(value, str):
+                raise ValueError(f"{name}[{key!r}] must be a genre string or null")
+            validated[key] = value
+        elif kind == 'years':
+            # Year ranges come back from JSON as lists; the rule dicts use (start, end) tuples
+            if not isinstance(value, list) or len(value) != 2 or not all(_is_number(v) for v in value):
+                raise ValueError(f"{name}[{key!r}] must be a [start, end] year pair or null")
+            validated[key] = tuple(value)
+        else:
+            raise ValueError(f"Unknown rule table kind for {name}: {kind}")
+    return validated
@@ -0,0 +1,298 @@
+"""Load-test harness for the recommendation API.
+
+Drives the FastAPI app in-process through an ASGI transport (the default) or a
+running uvicorn server (--url), and reports QPS, p50/p95/p99 latency and error
+rates per endpoint. Results are saved as JSON so runs can be compared.
+
+    python loadtest.py --requests 2000 --concurrency 16
+    python loadtest.py --url http://localhost:8000 --duration 60 --miss-rate 0.2
+    python loadtest.py --compare loadtest_results/run-a.json loadtest_results/run-b.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+import httpx
+
+import app as api
+
+# Endpoint path for each domain
+DOMAIN_ENDPOINTS = {
+    'book': '/recommendations/books/',
+    'anime': '/recommendations/anime/',
+    'movie': '/recommendations/movies/',
+}
+
+
+def domain_filters():
+    """Frontend filter values per domain, taken from the app's own mapping tables.
+
+    Read after the app has started, so values added in the rule config are included.
+    """
+    return {
+        'book': {
+            'mood': list(api.mood_to_book_genres),
+            'era': list(api.era_to_book_genres),
+            'genre': list(api.book_genre_mapping),
+        },
+        'anime': {
+            'mood': list(api.mood_to_anime_genres),
+            'era': list(api.era_to_anime_years),
+            'genre': list(api.anime_genre_mapping),
+        },
+        'movie': {
+            'mood': list(api.mood_to_movie_genres),
+            'era': list(api.era_to_movie_years),
+            'genre': list(api.movie_genre_mapping),
+        },
+    }
+
+
+def parse_mix(spec):
+    """Parse a 'book=0.5,anime=0.2,movie=0.3' domain mix into normalized weights."""
+    weights = {}
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        domain, _, weight = part.partition('=')
+        if domain not in DOMAIN_ENDPOINTS:
+            raise ValueError(f"Unknown domain in mix: {domain}")
+        weights[domain] = float(weight) if weight else 1.0
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Domain mix must have a positive total weight")
+    return {d: w / total for d, w in weights.items()}
+
+
+class RequestMix:
+    """Generates request payloads: domain, filter combination and seed titles."""
+
+    def __init__(self, catalogs, domain_mix, filter_rate=0.5, max_seeds=3,
+                 seed_dist='popular', miss_rate=0.0, seed=0):
+        self.rng = random.Random(seed)
+        self.domains = list(domain_mix)
+        self.domain_weights = [domain_mix[d] for d in self.domains]
+        self.filter_rate = filter_rate
+        self.max_seeds = max_seeds
+        self.miss_rate = miss_rate
+        self.filters = domain_filters()
+        self.titles = {}
+        self.title_weights = {}
+        for domain in self.domains:
+            df = catalogs[domain]
+            self.titles[domain] = df['title'].dropna().astype(str).tolist()
+            if seed_dist == 'popular' and 'num_votes' in df.columns:
+                votes = df.loc[df['title'].notna(), 'num_votes'].fillna(0).to_numpy(dtype=float)
+                self.title_weights[domain] = (votes + 1).tolist()
+            else:
+                self.title_weights[domain] = None
+
+    def next(self):
+        """Return (domain, payload, is_miss) for the next request."""
+        domain = self.rng.choices(self.domains, weights=self.domain_weights)[0]
+        payload = {'domain': domain}
+
+        # Each filter is set independently with probability filter_rate
+        for name, options in self.filters[domain].items():
+            if self.rng.random() < self.filter_rate:
+                payload[name] = self.rng.choice(options)
+
+        n_seeds = self.rng.randint(1, self.max_seeds)
+        is_miss = self.rng.random() < self.miss_rate
+        if is_miss:
+            payload['titles'] = [f"zz-no-such-title-{self.rng.getrandbits(32):08x}" for _ in range(n_seeds)]
+        else:
+            payload['titles'] = self.rng.choices(
+                self.titles[domain], weights=self.title_weights[domain], k=n_seeds
+            )
+        return domain, payload, is_miss
+
+
+async def run_load(client, mix, concurrency, total_requests=None, duration=None):
+    """Fire requests from `concurrency` workers and collect per-request samples."""
+    samples = []
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    def claim():
+        nonlocal issued
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if total_requests is not None and issued >= total_requests:
+            return False
+        issued += 1
+        return True
+
+    async def worker():
+        while claim():
+            domain, payload, is_miss = mix.next()
+            start = time.perf_counter()
+            try:
+                response = await client.post(DOMAIN_ENDPOINTS[domain], json=payload)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                print(f"Request error: {e}", file=sys.stderr)
+                status = 0
+            samples.append({
+                'endpoint': DOMAIN_ENDPOINTS[domain],
+                'latency_ms': (time.perf_counter() - start) * 1000,
+                'status': status,
+                'miss': is_miss,
+            })
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """Aggregate samples into overall and per-endpoint QPS, latency percentiles and error rates."""
+    def stats(rows):
+        latencies = np.array([r['latency_ms'] for r in rows], dtype=float)
+        errors = sum(1 for r in rows if not 200 <= r['status'] < 300)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+        return {
+            'requests': len(rows),
+            'qps': len(rows) / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(latencies.max()) if len(latencies) else 0.0,
+            'error_rate': errors / len(rows) if rows else 0.0,
+            'miss_requests': sum(1 for r in rows if r['miss']),
+        }
+
+    endpoints = {}
+    for endpoint in sorted(set(r['endpoint'] for r in samples)):
+        endpoints[endpoint] = stats([r for r in samples if r['endpoint'] == endpoint])
+    return {'elapsed_s': elapsed, 'overall': stats(samples), 'endpoints': endpoints}
+
+
+def print_summary(summary):
+    header = f"{'endpoint':<28}{'reqs':>8}{'qps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary['endpoints'].items()) + [('overall', summary['overall'])]
+    for name, s in rows:
+        print(f"{name:<28}{s['requests']:>8}{s['qps']:>9.1f}{s['p50_ms']:>9.1f}"
+              f"{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['error_rate'] * 100:>7.1f}%")
+
+
+def compare_results(baseline_path, candidate_path):
+    """Print the per-endpoint change between two saved runs."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['summary']
+    with open(candidate_path) as f:
+        candidate = json.load(f)['summary']
+
+    print(f"{'endpoint':<28}{'metric':<8}{'baseline':>11}{'candidate':>11}{'change':>9}")
+    names = sorted(set(baseline['endpoints']) | set(candidate['endpoints'])) + ['overall']
+    for name in names:
+        old = baseline['overall'] if name == 'overall' else baseline['endpoints'].get(name)
+        new = candidate['overall'] if name == 'overall' else candidate['endpoints'].get(name)
+        if old is None or new is None:
+            print(f"{name:<28}only present in one run")
+            continue
+        for metric in ['qps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate']:
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{name:<28}{metric.replace('_ms', ''):<8}{old[metric]:>11.2f}{new[metric]:>11.2f}{change:>8.1f}%")
+
+
+@contextlib.asynccontextmanager
+async def make_client(url, timeout):
+    """Client for a running server, or one wired to the app in-process with its startup run."""
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=timeout) as client:
+            yield client
+
+
+async def load_catalogs(url):
+    """Catalogs to draw seed titles from; against a server we load the same files and rules it does."""
+    if url:
+        await api.startup_db_client()
+        await api.startup_movie_db()
+        api.rule_tables.refresh()
+    return {domain: getattr(api.app, f"{domain}_df") for domain in DOMAIN_ENDPOINTS}
+
+
+async def main_async(args):
+    domain_mix = parse_mix(args.mix)
+
+    async with make_client(args.url, args.timeout) as client:
+        # Keep the app's per-request prints out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            catalogs = await load_catalogs(args.url)
+        mix = RequestMix(catalogs, domain_mix, args.filter_rate, args.max_seeds,
+                         args.seed_dist, args.miss_rate, args.seed)
+
+        if args.warmup:
+            with contextlib.redirect_stdout(io.StringIO()):
+                await run_load(client, mix, args.concurrency, total_requests=args.warmup)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            samples, elapsed = await run_load(
+                client, mix, args.concurrency,
+                total_requests=None if args.duration else args.requests,
+                duration=args.duration,
+            )
+
+    summary = summarize(samples, elapsed)
+    print_summary(summary)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = args.name or datetime.now().strftime('run-%Y%m%d-%H%M%S')
+    result_path = os.path.join(args.output_dir, f"{name}.json")
+    with open(result_path, 'w') as f:
+        json.dump({
+            'name': name,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'config': vars(args),
+            'summary': summary,
+        }, f, indent=2)
+    print(f"Saved results to {result_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the recommendation API.")
+    parser.add_argument('--url', help="Base URL of a running server; default drives the app in-process")
+    parser.add_argument('--concurrency', type=int, default=8, help="Number of concurrent clients")
+    parser.add_argument('--requests', type=int, default=500, help="Total requests (ignored with --duration)")
+    parser.add_argument('--duration', type=float, help="Run for this many seconds instead of a fixed count")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed requests sent before measuring")
+    parser.add_argument('--mix', default='book=1,anime=1,movie=1', help="Domain weights, e.g. book=0.5,movie=0.5")
+    parser.add_argument('--filter-rate', type=float, default=0.5, help="Probability each of mood/era/genre is set")
+    parser.add_argument('--max-seeds', type=int, default=3, help="Maximum seed titles per request")
+    parser.add_argument('--seed-dist', choices=['popular', 'uniform'], default='popular',
+                        help="Draw seed titles weighted by num_votes or uniformly")
+    parser.add_argument('--miss-rate', type=float, default=0.0, help="Fraction of requests with unknown titles")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the request mix")
+    parser.add_argument('--output-dir', default='loadtest_results', help="Directory for saved results")
+    parser.add_argument('--name', help="Name of the saved run (defaults to a timestamp)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Compare two saved runs instead of running a test")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Opt-in per-request profiling for the recommendation endpoints.
+
+Profiling is off unless enabled through the environment:
+
+    MEDIAMATCHR_PROFILE_SAMPLE_RATE   fraction of requests to profile (default 0)
+    MEDIAMATCHR_PROFILE_ALLOW_HEADER  set to 1 to let clients ask for a profile with `X-Profile: 1`
+    MEDIAMATCHR_PROFILE_FORMAT        pstats, collapsed or both (default pstats)
+    MEDIAMATCHR_PROFILE_DIR           where dumps and the slow-request logs go (default ./profiles)
+    MEDIAMATCHR_PROFILE_KEEP          number of dumps kept before the oldest are removed (default 200)
+    MEDIAMATCHR_SLOW_REQUEST_MS       log any request slower than this, profiled or not (default 1000)
+
+pstats dumps (.prof) open with `python -m pstats` or snakeviz. Collapsed stacks
+(.collapsed) come from a sampling thread and feed straight into flamegraph.pl
+or speedscope. Each worker process writes its own slow_requests.<pid>.log, since
+log rotation is not safe with several processes sharing one file.
+"""
+import os
+import sys
+import time
+import json
+import random
+import cProfile
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+PROFILE_HEADER = b'x-profile'
+
+# Interval between stack samples for the collapsed format, in seconds
+SAMPLE_INTERVAL = 0.001
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        print(f"Ignoring invalid {name}={os.environ[name]!r}")
+        return default
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles sampled or opted-in requests and logs slow ones."""
+
+    def __init__(self, app, path_prefix='/recommendations'):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.sample_rate = _env_float('MEDIAMATCHR_PROFILE_SAMPLE_RATE', 0.0)
+        self.allow_header = os.environ.get('MEDIAMATCHR_PROFILE_ALLOW_HEADER', '0') == '1'
+        self.formats = os.environ.get('MEDIAMATCHR_PROFILE_FORMAT', 'pstats')
+        self.profile_dir = os.environ.get('MEDIAMATCHR_PROFILE_DIR', 'profiles')
+        self.keep = int(_env_float('MEDIAMATCHR_PROFILE_KEEP', 200))
+        self.slow_ms = _env_float('MEDIAMATCHR_SLOW_REQUEST_MS', 1000)
+        # Only one profiler can be active per interpreter, so concurrent requests skip profiling
+        self._busy = threading.Lock()
+        self._slow_log = None
+        self._slow_log_pid = None
+
+    def _wants_profile(self, scope):
+        if self.allow_header and (PROFILE_HEADER, b'1') in scope.get('headers', []):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _slow_logger(self):
+        # A worker forked after the first slow request must open its own log
+        if self._slow_log is None or self._slow_log_pid != os.getpid():
+            os.makedirs(self.profile_dir, exist_ok=True)
+            # One log per worker process: RotatingFileHandler renames files on rollover,
+            # which would clobber another worker writing to the same file
+            logger = logging.getLogger(f'mediamatchr.slow_requests.{os.getpid()}')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(
+                os.path.join(self.profile_dir, f'slow_requests.{os.getpid()}.log'),
+                maxBytes=5 * 1024 * 1024, backupCount=3
+            )
+            logger.addHandler(handler)
+            self._slow_log = logger
+            self._slow_log_pid = os.getpid()
+        return self._slow_log
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self._wants_profile(scope) and self._busy.acquire(blocking=False)
+        body = bytearray()
+        status = {'code': 500}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message['type'] == 'http.request':
+                body.extend(message.get('body', b''))
+            return message
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        profiler = sampler = None
+        if profile:
+            if self.formats in ('pstats', 'both'):
+                profiler = cProfile.Profile()
+            if self.formats in ('collapsed', 'both'):
+                sampler = StackSampler(threading.get_ident())
+
+        start = time.perf_counter()
+        try:
+            if sampler:
+                sampler.start()
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            if profiler:
+                profiler.disable()
+            if sampler:
+                sampler.stop()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            dump_name = None
+            if profile:
+                try:
+                    dump_name = self._write_dumps(scope, elapsed_ms, profiler, sampler)
+                finally:
+                    self._busy.release()
+            if elapsed_ms >= self.slow_ms:
+                self._log_slow(scope, elapsed_ms, status['code'], bytes(body), dump_name)
+
+    def _write_dumps(self, scope, elapsed_ms, profiler, sampler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        endpoint = scope['path'].strip('/').replace('/', '_') or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}_{elapsed_ms:.0f}ms"
+        if profiler:
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+        if sampler:
+            sampler.write(os.path.join(self.profile_dir, f"{name}.collapsed"))
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        """Keep only the newest `keep` dumps of each format."""
+        for ext in ('.prof', '.collapsed'):
+            dumps = sorted(f for f in os.listdir(self.profile_dir) if f.endswith(ext))
+            for old in dumps[:max(len(dumps) - self.keep, 0)]:
+                try:
+                    os.remove(os.path.join(self.profile_dir, old))
+                except FileNotFoundError:
+                    pass
+
+    def _log_slow(self, scope, elapsed_ms, status_code, body, dump_name):
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = body[:500].decode('utf-8', 'replace')
+        self._slow_logger().info(json.dumps({
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'path': scope['path'],
+            'latency_ms': round(elapsed_ms, 1),
+            'status': status_code,
+            'request': payload,
+            'profile': dump_name,
+        }))
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+import artifacts
+
+
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('MEDIAMATCHR_ARTIFACT_DIR', str(tmp_path))
+    monkeypatch.setattr(artifacts, '_attached', {})
+    return tmp_path / 'book'
+
+
+def build(value):
+    return lambda: {'latent': np.full((3, 2), value, dtype=np.float32)}
+
+
+def staging_dirs(domain_dir):
+    return [name for name in os.listdir(domain_dir) if name.startswith('.') and (domain_dir / name).is_dir()]
+
+
+def test_pinned_worker_keeps_pruned_version(artifact_dir):
+    artifacts.load_or_build_artifacts('book', 'v1', build(1))
+    # Pruning keeps the newest versions by mtime, so make the publish order explicit
+    os.utime(artifact_dir / 'v1', (1, 1))
+    artifacts.load_or_build_artifacts('book', 'v2', build(2))
+    os.utime(artifact_dir / 'v2', (2, 2))
+    artifacts.load_or_build_artifacts('book', 'v3', build(3))
+
+    versions = sorted(name for name in os.listdir(artifact_dir) if not name.startswith('.') and name != 'CURRENT')
+    assert len(versions) == artifacts.ARTIFACT_KEEP_VERSIONS
+    assert versions == ['v2', 'v3']
+    assert (artifact_dir / 'CURRENT').read_text() == 'v3'
+
+    # A worker whose catalog is still v1 keeps reading the arrays it attached to
+    assert np.all(artifacts.get_artifacts('book', 'v1')['latent'] == 1)
+    assert artifacts.get_artifacts('book').version == 'v3'
+
+
+def test_stale_staging_removed_on_next_build(artifact_dir):
+    stale = artifact_dir / '.v0-abcd1234'
+    stale.mkdir(parents=True)
+    (stale / 'latent.npy').write_bytes(b'partial')
+
+    artifacts.load_or_build_artifacts('book', 'v1', build(1))
+    assert not stale.exists()
+    assert staging_dirs(artifact_dir) == []
+
+
+def test_failed_build_leaves_current_alone(artifact_dir):
+    artifacts.load_or_build_artifacts('book', 'v1', build(1))
+
+    def failing_build():
+        raise RuntimeError("build failed")
+
+    class FailingArrays(dict):
+        # Fails after the first array has been written into the staging directory
+        def items(self):
+            yield 'latent', np.zeros((3, 2))
+            raise RuntimeError("save failed")
+
+    with pytest.raises(RuntimeError):
+        artifacts.load_or_build_artifacts('book', 'v2', failing_build)
+    with pytest.raises(RuntimeError):
+        artifacts.load_or_build_artifacts('book', 'v3', FailingArrays)
+
+    assert staging_dirs(artifact_dir) == []
+    assert not (artifact_dir / 'v2').exists() and not (artifact_dir / 'v3').exists()
+    assert (artifact_dir / 'CURRENT').read_text() == 'v1'
+    assert np.all(artifacts.get_artifacts('book')['latent'] == 1)
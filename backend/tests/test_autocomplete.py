@@ -0,0 +1,69 @@
+import pandas as pd
+
+import app as api
+
+
+def make_catalog():
+    return pd.DataFrame({
+        'item_id': ['1', '2', '3', '4', '5'],
+        'title': ['Star Wars', 'Star Trek', 'star wars', 'Stardust', 'Moon (x)'],
+        'num_votes': [100, 300, 50, 200, 10],
+    })
+
+
+def test_prefix_search_ranks_by_votes_and_dedupes():
+    df = make_catalog()
+    rows = api.search_title_prefix(api.build_title_index(df), 'star', limit=10)
+    # 'star wars' appears twice; only its most-voted row is kept
+    assert rows == [1, 3, 0]
+
+
+def test_prefix_search_limit_and_miss():
+    title_index = api.build_title_index(make_catalog())
+    assert api.search_title_prefix(title_index, 'star', limit=1) == [1]
+    assert api.search_title_prefix(title_index, 'zzz') == []
+
+
+def test_title_index_falls_back_without_artifacts(monkeypatch):
+    df = make_catalog()
+    monkeypatch.setattr(api.app, 'book_df', df, raising=False)
+    monkeypatch.setattr(api.app, 'artifact_versions', {}, raising=False)
+    monkeypatch.setattr(api.app, 'title_indexes', {}, raising=False)
+    title_index = api.get_title_index('book')
+    assert title_index is not None
+    assert api.search_title_prefix(title_index, 'moon') == [4]
+
+
+def test_autocompleted_titles_resolve_exactly():
+    df = make_catalog()
+    # Regex metacharacters are matched literally, and exact titles win over substrings
+    assert api.match_seed_indices(['Moon (x)', 'star wars', 'Star ('], df) == [4, 0]
+    assert api.match_seed_indices(['Star Wars'], df, best_match=True) == [0]
+    assert api.match_seed_indices(['Star'], df, best_match=True) == [1]
+
+
+def test_duplicate_exact_titles_seed_the_autocompleted_row():
+    df = pd.DataFrame({
+        'item_id': ['a', 'b', 'c', 'd'],
+        'title': ['Hamlet', 'Hamlet', 'hamlet', 'Hamlet 2'],
+        'num_votes': [5, 5000, 5000, 10],
+    })
+    rows = api.search_title_prefix(api.build_title_index(df), 'hamlet', limit=1)
+    assert rows == [1]
+    for best_match in [False, True]:
+        assert api.match_seed_indices([df['title'][rows[0]]], df, best_match=best_match) == rows
+
+
+def test_title_index_stores_utf8_without_padding():
+    df = pd.DataFrame({
+        'title': ['Amélie', 'Ämter', 'Amelia', '東京物語', 'x' * 400],
+        'num_votes': [5, 4, 3, 2, 1],
+    })
+    title_index = api.build_title_index(df)
+    # One buffer sized by the total title length, not rows times the longest title
+    assert title_index['title_bytes'].nbytes == sum(len(t.lower().encode('utf-8')) for t in df['title'])
+    assert api.search_title_prefix(title_index, 'am') == [0, 2]
+    assert api.search_title_prefix(title_index, 'amé') == [0]
+    assert api.search_title_prefix(title_index, 'ä') == [1]
+    assert api.search_title_prefix(title_index, '東京') == [3]
+    assert api.search_title_prefix(title_index, 'xx') == [4]
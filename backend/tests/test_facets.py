@@ -0,0 +1,104 @@
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as api
+from facets import RuleTables, build_genre_bits, compile_facets
+
+MOODS = [None, 'light', 'thought-provoking', 'escape', 'learn', 'emotional', 'adventurous', 'bogus']
+ERAS = [None, 'any', 'classic', 'mid-century', 'modern', 'contemporary', 'bogus']
+
+GENRES = {
+    'book': ['Fiction', 'Fantasy', 'Science Fiction', 'Romance', 'Humor', 'Classics',
+             '20th Century', '21st Century', 'Contemporary', 'Nonfiction', 'History'],
+    'anime': ['Action', 'Comedy', 'Drama', 'Fantasy', 'Sci-Fi', 'Romance', 'Slice of Life', 'Mystery'],
+    'movie': ['Action', 'Comedy', 'Drama', 'Fantasy', 'Horror', 'Sci-Fi', 'Thriller', 'Family', 'Western'],
+}
+
+# (mood rules, era rules, genre mapping, era year column)
+RULES = {
+    'book': (api.mood_to_book_genres, api.era_to_book_genres, api.book_genre_mapping, None),
+    'anime': (api.mood_to_anime_genres, api.era_to_anime_years, api.anime_genre_mapping, 'aired_from_year'),
+    'movie': (api.mood_to_movie_genres, api.era_to_movie_years, api.movie_genre_mapping, 'year'),
+}
+
+
+def make_catalog(domain, n=300):
+    rng = np.random.default_rng(1)
+    genres = [','.join(rng.choice(GENRES[domain], size=rng.integers(1, 4), replace=False)) for _ in range(n)]
+    df = pd.DataFrame({
+        'title': [f'Item {i}' for i in range(n)],
+        'num_votes': rng.integers(1, 1000, n),
+        'genres' if domain == 'book' else 'genre': genres,
+    })
+    years = rng.integers(1950, 2024, n).astype(float)
+    years[:10] = np.nan
+    if domain == 'anime':
+        df['aired_from_year'] = years
+    elif domain == 'movie':
+        df['year'] = years
+    return df
+
+
+def make_facets(df, domain):
+    mood_rules, era_rules, genre_rules, era_year_column = RULES[domain]
+    genre_col = 'genres' if domain == 'book' else 'genre'
+    genre_vocab, genre_bits = build_genre_bits(df, genre_col)
+    return compile_facets(df, mood_rules, era_rules, genre_rules, genre_vocab, genre_bits, era_year_column)
+
+
+@pytest.mark.parametrize('domain', ['book', 'anime', 'movie'])
+def test_facet_filters_match_rule_filters(domain):
+    df = make_catalog(domain)
+    facets = make_facets(df, domain)
+    genres = [None, 'bogus'] + list(RULES[domain][2])
+    for mood, era, genre in itertools.product(MOODS, ERAS, genres):
+        if domain == 'movie':
+            expected = api.filter_movie_dataset(df, mood, era, genre)
+            actual = api.filter_movie_dataset(df, mood, era, genre, facets)
+        else:
+            expected = api.filter_dataset(df, mood, era, genre, domain)
+            actual = api.filter_dataset(df, mood, era, genre, domain, facets)
+        assert actual.index.equals(expected.index), (mood, era, genre)
+
+
+def make_rule_tables(path):
+    moods = {'light': ['Comedy']}
+    eras = {'classic': (1900, 1970), 'any': None}
+    return RuleTables({'moods': (moods, 'genres'), 'eras': (eras, 'years')}, str(path)), moods, eras
+
+
+@pytest.mark.parametrize('bad_config', [
+    {'moods': ['x']},
+    {'moods': {'light': 'Comedy'}},
+    {'eras': {'classic': [1900]}},
+    {'eras': {'classic': ['1900', '1970']}},
+    ['moods'],
+])
+def test_invalid_rule_file_keeps_current_rules(tmp_path, bad_config):
+    path = tmp_path / 'facets.json'
+    rule_tables, moods, eras = make_rule_tables(path)
+    assert rule_tables.refresh()
+
+    path.write_text(json.dumps(bad_config))
+    assert not rule_tables.refresh()
+    assert moods == {'light': ['Comedy']}
+    assert eras == {'classic': (1900, 1970), 'any': None}
+
+    # The bad file is retried, so fixing it applies without a restart
+    path.write_text(json.dumps({'eras': {'classic': [1900, 1950]}}))
+    assert rule_tables.refresh()
+    assert eras == {'classic': (1900, 1950)}
+    assert moods == {'light': ['Comedy']}
+
+
+def test_malformed_json_keeps_current_rules(tmp_path):
+    path = tmp_path / 'facets.json'
+    rule_tables, moods, _ = make_rule_tables(path)
+    rule_tables.refresh()
+    path.write_text('{"moods": ')
+    assert not rule_tables.refresh()
+    assert moods == {'light': ['Comedy']}
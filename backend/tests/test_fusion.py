@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from sklearn.neighbors import NearestNeighbors
+
+import app as api
+
+
+def make_model():
+    # Two tight clusters: items 0-3 around one direction, 4-7 around another
+    rng = np.random.default_rng(0)
+    latent = np.vstack([
+        np.array([1.0, 0.0]) + rng.normal(0, 0.05, (4, 2)),
+        np.array([0.0, 1.0]) + rng.normal(0, 0.05, (4, 2)),
+    ])
+    knn = NearestNeighbors(n_neighbors=6, metric='cosine').fit(latent)
+    return latent, knn
+
+
+def test_fusion_excludes_seeds_and_dedupes():
+    latent, knn = make_model()
+    for fusion in ["rrf", "max"]:
+        result = api.fuse_seed_neighbors(latent, knn, [0, 4, 0], n_recommendations=6, fusion=fusion)
+        assert 0 not in result and 4 not in result
+        assert len(result) == len(set(result)) == 6
+
+
+def test_fusion_draws_from_every_seed():
+    latent, knn = make_model()
+    result = api.fuse_seed_neighbors(latent, knn, [0, 4], n_recommendations=4, fusion="rrf")
+    assert set(result) & {1, 2, 3}
+    assert set(result) & {5, 6, 7}
+
+
+def test_default_mode_keeps_duplicate_seeds():
+    df = pd.DataFrame({'title': ['Alpha', 'Beta'], 'num_votes': [1, 2]})
+    assert api.match_seed_indices(['Alpha', 'alpha', 'Beta'], df) == [0, 0, 1]
+
+
+def test_unknown_fusion_is_rejected():
+    client = TestClient(api.app)
+    response = client.post('/recommendations/books/', json={'titles': ['x'], 'fusion': 'bogus'})
+    assert response.status_code == 422